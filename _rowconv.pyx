@@ -0,0 +1,61 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Optional compiled row converter for convert_gprof_csv_to_sqlite.py.
+
+Build in place with:  cythonize -i _rowconv.pyx
+When the extension is not built, the converter uses its pure-Python path.
+"""
+
+# Column type codes; must match convert_gprof_csv_to_sqlite.TYPE_CODES
+cdef enum:
+    TYPE_TEXT = 0
+    TYPE_REAL = 1
+    TYPE_INTEGER = 2
+
+
+cdef object _bracket_int(str value):
+    """Same result as re.search(r'\\[(\\d+)\\]', value): first bracketed number, or None."""
+    cdef Py_ssize_t n = len(value)
+    cdef Py_ssize_t i = 0
+    cdef Py_ssize_t j
+    cdef Py_UCS4 ch
+    while i < n:
+        if value[i] != u'[':
+            i += 1
+            continue
+        j = i + 1
+        while j < n:
+            ch = value[j]
+            if not ch.isdecimal():
+                break
+            j += 1
+        if j > i + 1 and j < n and value[j] == u']':
+            return int(value[i + 1:j])
+        # value[j] is not part of a match starting at i; it may itself be a '['
+        i = j
+    return None
+
+
+cpdef list convert_row(row, const int[:] type_codes):
+    """Convert one padded CSV row to Python values using per-column type codes."""
+    cdef Py_ssize_t i
+    cdef Py_ssize_t n = type_codes.shape[0]
+    cdef int code
+    cdef list out = []
+    cdef str val
+    for i in range(n):
+        val = row[i]
+        if not val or val.isspace():
+            out.append(None)
+            continue
+        code = type_codes[i]
+        if code == TYPE_REAL:
+            try:
+                out.append(float(val))
+            except ValueError:
+                out.append(None)
+        elif code == TYPE_INTEGER:
+            out.append(_bracket_int(val))
+        else:
+            out.append(val)
+    return out
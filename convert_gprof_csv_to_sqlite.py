@@ -2,9 +2,50 @@
 import argparse
 import csv
 import os
+import queue
 import re
 import sqlite3
-from typing import List, Tuple, Dict, Any
+import threading
+from array import array
+from functools import lru_cache
+from typing import List, Tuple, Dict
+
+# Schema version the report tools check in PRAGMA user_version, and the
+# table names they accept
+from query_gprof_db import INDEX_SCHEMA_VERSION, validate_table_identifier
+
+# Optional native CSV parser; the stdlib csv module is used when it is missing
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+    pc = None
+    pacsv = None
+
+# Optional compiled row converter (cythonize -i _rowconv.pyx); pure Python otherwise
+try:
+    from _rowconv import convert_row as _convert_row_compiled
+except ImportError:
+    _convert_row_compiled = None
+
+# Type codes understood by _rowconv.convert_row
+TYPE_CODES = {"TEXT": 0, "REAL": 1, "INTEGER": 2}
+
+# Pattern used on every CSV row; compile once at import time
+_BRACKET_IDX_RE = re.compile(r'\[(\d+)\]')
+# Header sanitizing: anything outside [a-z0-9] collapses to one "_"
+_INVALID_RUN_RE = re.compile(r"[^a-z0-9]+")
+
+# Header substrings that mark a column as REAL (CPU time values)
+_REAL_HINTS = ("cpu_time", "time_self", "time_children", "time_total", "% cpu")
+
+# Self + children time, kept as the generated "cpu_sum" column
+CPU_SUM_SQL = "COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0)"
+
+# Read the CSV in 1 MiB chunks rather than the 8 KiB default
+READ_BUFFER_SIZE = 1024 * 1024
 
 
 def sanitize_column(name: str, used: set, index: int) -> str:
@@ -15,15 +56,12 @@ def sanitize_column(name: str, used: set, index: int) -> str:
     # Fallback if empty
     if not name:
         name = f"col_{index+1}"
-    # Replace spaces and invalid chars
-    name = name.lower()
-    name = name.replace(" ", "_")
-    name = re.sub(r"[^a-z0-9_]", "_", name)
+    # Replace each run of spaces, underscores and invalid chars with a single underscore
+    name = _INVALID_RUN_RE.sub("_", name.lower())
     # Avoid leading digits
-    if re.match(r"^[0-9]", name):
+    if name[:1].isdigit():
         name = f"c_{name}"
-    # Collapse multiple underscores
-    name = re.sub(r"_+", "_", name).strip("_") or f"col_{index+1}"
+    name = name.strip("_") or f"col_{index+1}"
     # Ensure uniqueness
     base = name
     suffix = 1
@@ -34,38 +72,44 @@ def sanitize_column(name: str, used: set, index: int) -> str:
     return name
 
 
-def infer_headers(reader: csv.reader) -> List[str]:
-    try:
-        raw_headers = next(reader)
-    except StopIteration:
-        return []
-    used = set()
-    headers = [sanitize_column(h, used, i) for i, h in enumerate(raw_headers)]
-    return headers
-
-
+@lru_cache(maxsize=1 << 16)
 def extract_index_number(value: str) -> int:
-    """Extract numeric value from bracketed index like '[196]'."""
+    """Extract numeric value from bracketed index like '[196]'.
+
+    Memoized: the same bracket strings recur across many caller/callee rows.
+    """
     if not value:
         return None
-    match = re.search(r'\[(\d+)\]', value)
+    match = _BRACKET_IDX_RE.search(value)
     return int(match.group(1)) if match else None
 
 
-def infer_column_types(headers: List[str]) -> Dict[str, str]:
-    """Map column names to SQL types based on header semantics."""
+def infer_column_type(name: str) -> str:
+    """Map a sanitized column name to its SQL type based on header semantics."""
+    # sanitize_column has already lower-cased the name
+    # CPU time columns should be REAL (floating point)
+    if any(x in name for x in _REAL_HINTS):
+        return "REAL"
+    # Index columns containing numbers in brackets - store extracted value as INTEGER
+    if "index" in name:
+        return "INTEGER"
+    return "TEXT"
+
+
+def infer_headers_and_types(reader: csv.reader) -> Tuple[List[str], Dict[str, str]]:
+    """Read the header row; return sanitized column names and their SQL types in one pass."""
+    try:
+        raw_headers = next(reader)
+    except StopIteration:
+        return [], {}
+    used = set()
+    headers = []
     types = {}
-    for h in headers:
-        lower = h.lower()
-        # CPU time columns should be REAL (floating point)
-        if any(x in lower for x in ["cpu_time", "time_self", "time_children", "time_total", "% cpu"]):
-            types[h] = "REAL"
-        # Index columns containing numbers in brackets - store extracted value as INTEGER
-        elif "index" in lower:
-            types[h] = "INTEGER"
-        else:
-            types[h] = "TEXT"
-    return types
+    for i, raw in enumerate(raw_headers):
+        h = sanitize_column(raw, used, i)
+        headers.append(h)
+        types[h] = infer_column_type(h)
+    return headers, types
 
 
 def create_table(conn: sqlite3.Connection, table: str, headers: List[str], column_types: Dict[str, str]):
@@ -73,6 +117,9 @@ def create_table(conn: sqlite3.Connection, table: str, headers: List[str], colum
     cols = ", ".join(f'"{h}" {column_types.get(h, "TEXT")}' for h in headers)
     # Include parent_index for easy querying of relationships
     cols += ', "parent_index" INTEGER'
+    # Precompute self + children time for the report tools
+    if "cpu_time_self" in headers and "cpu_time_children" in headers:
+        cols += f', "cpu_sum" REAL GENERATED ALWAYS AS ({CPU_SUM_SQL}) STORED'
     sql = f'CREATE TABLE IF NOT EXISTS "{table}" ({cols});'
     conn.execute(sql)
 
@@ -91,90 +138,280 @@ def ensure_parent_index_column(conn: sqlite3.Connection, table: str):
         conn.commit()
 
 
+def ensure_cpu_sum_column(conn: sqlite3.Connection, table: str):
+    """Ensure the generated cpu_sum column exists; add it if missing."""
+    # Generated columns are hidden from table_info, so look in table_xinfo
+    cols = {row[1] for row in conn.execute(f'PRAGMA table_xinfo("{table}")')}
+    if 'cpu_sum' not in cols and {'cpu_time_self', 'cpu_time_children'} <= cols:
+        # ALTER TABLE can only add VIRTUAL generated columns
+        conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "cpu_sum" REAL GENERATED ALWAYS AS ({CPU_SUM_SQL}) VIRTUAL')
+        conn.commit()
+
+
 def is_empty_row(row: List[str]) -> bool:
     """Check if a row is empty (all fields are empty or whitespace)."""
-    return all(not field or not field.strip() for field in row)
+    return not any(field and not field.isspace() for field in row)
 
 
 def is_parent_row(row: List[str]) -> bool:
     """Check if a row is a parent (has index in brackets in both first and last columns)."""
     if len(row) < 2:
         return False
-    first_col = row[0].strip() if row[0] else ""
-    last_col = row[-1].strip() if row[-1] else ""
+    # Child rows leave the first column empty; reject them before stripping anything
+    if not row[0] or not row[-1]:
+        return False
+    # Strip each end column once (str.strip returns the same object when there is nothing to remove)
+    first_col = row[0].strip()
+    if not (first_col.startswith('[') and first_col.endswith(']')):
+        return False
+    last_col = row[-1].strip()
+    if not (last_col.startswith('[') and last_col.endswith(']')):
+        return False
     # Check if both first and last columns have values in brackets
-    return (bool(re.match(r'^\[\d+\]$', first_col)) and 
-            bool(re.match(r'^\[\d+\]$', last_col)))
+    return first_col[1:-1].isdecimal() and last_col[1:-1].isdecimal()
 
 
-def insert_rows(conn: sqlite3.Connection, table: str, headers: List[str], column_types: Dict[str, str], rows_iter, batch_size: int = 1000):
-    # Determine if parent_index exists to shape INSERT list
-    cols = get_table_columns(conn, table)
-    include_parent_index = 'parent_index' in cols
-    placeholders = ", ".join(["?"] * (len(headers) + (1 if include_parent_index else 0)))
-    cols_quoted = ", ".join([f'"{h}"' for h in headers])
-    if include_parent_index:
-        cols_quoted += ', "parent_index"'
-    sql = f'INSERT INTO "{table}" ({cols_quoted}) VALUES ({placeholders})'
-    batch: List[Tuple[Any, ...]] = []
-    count = 0
-    current_parent_index = None
-    
+def apply_bulk_load_pragmas(conn: sqlite3.Connection):
+    """Tune the connection for a one-shot bulk load (WAL, relaxed fsync, large cache)."""
+    # page_size only takes effect on a fresh database, so it must come before anything else
+    conn.execute("PRAGMA page_size=8192")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-200000")
+
+
+def float_or_none(value: str):
+    """Convert a cell to float, or None if it is empty or not numeric."""
+    # Empty cells are common in child rows; skip the cost of raising ValueError
+    if not value or value.isspace():
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def text_or_none(value: str):
+    """Return the cell unchanged, or None if it is empty or whitespace."""
+    return value if value and not value.isspace() else None
+
+
+def build_converters(headers: List[str], column_types: Dict[str, str]) -> list:
+    """Return one conversion function per column, chosen from its SQL type."""
+    converters = []
+    for h in headers:
+        col_type = column_types.get(h, "TEXT")
+        if col_type == "REAL":
+            converters.append(float_or_none)
+        elif col_type == "INTEGER":
+            # Try to extract index number from brackets
+            converters.append(extract_index_number)
+        else:
+            converters.append(text_or_none)
+    return converters
+
+
+def _mark_empty_rows(rows_iter, ncols: int):
+    """Yield each row trimmed to ``ncols`` fields, or None in place of an empty separator row."""
     for row in rows_iter:
-        # Pad or trim row to match headers length
-        if len(row) < len(headers):
-            row = row + ["" for _ in range(len(headers) - len(row))]
-        elif len(row) > len(headers):
-            row = row[:len(headers)]
-        
-        # Check if this is an empty row (signals end of children)
-        if is_empty_row(row):
+        # Stray fields past the last header are dropped before the emptiness test
+        if len(row) > ncols:
+            row = row[:ncols]
+        # any() rejects all-"" rows in C; the whitespace scan only runs for the rest
+        if any(row) and not is_empty_row(row):
+            yield row
+        else:
+            yield None
+
+
+def _row_iter(rows_iter, headers: List[str], column_types: Dict[str, str], include_parent_index: bool):
+    """Yield a list of converted values for every non-empty CSV row."""
+    current_parent_index = None
+    ncols = len(headers)
+    converters = build_converters(headers, column_types)
+    type_codes = None
+    if _convert_row_compiled is not None:
+        type_codes = array("i", [TYPE_CODES[column_types.get(h, "TEXT")] for h in headers])
+    index_col = headers.index("index") if "index" in headers else -1
+
+    for row in _mark_empty_rows(rows_iter, ncols):
+        # An empty row signals end of children
+        if row is None:
             # Reset parent tracking and skip inserting empty rows
             current_parent_index = None
             continue
         
+        # Pad short rows to match headers length (long ones were trimmed above)
+        if len(row) < ncols:
+            row = row + [""] * (ncols - len(row))
+        
         # If this is a parent row (index in first and last columns), set current parent
-        if is_parent_row(row):
+        is_parent = is_parent_row(row)
+        if is_parent:
             current_parent_index = extract_index_number(row[-1])
         
         # Convert values based on column types
-        converted_row = []
-        for i, (h, val) in enumerate(zip(headers, row)):
-            col_type = column_types.get(h, "TEXT")
-            if not val or not val.strip():
-                # Special case: for the first "index" column of child rows, fill with current parent index
-                if h.lower() == "index" and current_parent_index is not None and not is_parent_row(row):
-                    converted_row.append(current_parent_index)
-                else:
-                    converted_row.append(None)
-            elif col_type == "REAL":
-                try:
-                    converted_row.append(float(val))
-                except (ValueError, TypeError):
-                    converted_row.append(None)
-            elif col_type == "INTEGER":
-                # Try to extract index number from brackets
-                idx_num = extract_index_number(val)
-                converted_row.append(idx_num)
-            else:
-                converted_row.append(val)
+        if type_codes is not None:
+            converted_row = _convert_row_compiled(row, type_codes)
+        else:
+            converted_row = [conv(val) for conv, val in zip(converters, row)]
+        # Special case: for the first "index" column of child rows, fill with current parent index
+        if index_col >= 0 and current_parent_index is not None and not is_parent:
+            raw = row[index_col]
+            if not raw or raw.isspace():
+                converted_row[index_col] = current_parent_index
         # Append explicit parent_index column value if schema supports it
         if include_parent_index:
-            if is_parent_row(row):
+            if is_parent:
                 converted_row.append(None)
             else:
                 converted_row.append(current_parent_index)
 
-        batch.append(tuple(converted_row))
-        if len(batch) >= batch_size:
-            conn.executemany(sql, batch)
-            conn.commit()
+        # executemany accepts any sequence, so the list is bound as-is
+        yield converted_row
+
+
+def _arrow_blank(column):
+    """Arrow mask of the cells text_or_none() maps to None: empty or all whitespace."""
+    return pc.or_(pc.equal(column, ""), pc.utf8_is_space(column))
+
+
+def _arrow_bracket_number(column, anchored: bool = False):
+    """Arrow column of the bracketed index number in each cell (extract_index_number), or null."""
+    pattern = r"^\[(?P<n>\d+)\]$" if anchored else r"\[(?P<n>\d+)\]"
+    return pc.cast(pc.struct_field(pc.extract_regex(column, pattern=pattern), "n"), pa.int64())
+
+
+def read_rows_arrow(csv_path: str, headers: List[str], column_types: Dict[str, str],
+                    delimiter: str, quotechar: str, encoding: str):
+    """Parse and convert the data rows column-wise with pyarrow.
+
+    Does what _row_iter() does row by row: REAL/INTEGER/TEXT conversion,
+    parent tracking, filling child rows' "index" and dropping separator rows,
+    all as pyarrow.compute kernels.  The whole file is materialised, so peak
+    memory grows with the input size.  Any ArrowException (ragged rows, a
+    cell float() would turn into None) is raised before a row is yielded, so
+    the caller can fall back to the csv module.
+
+    Returns an iterator of converted rows ending with their parent_index.
+    """
+    table = pacsv.read_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(column_names=headers, skip_rows=1, encoding=encoding, block_size=16 << 20),
+        # Keep blank lines as all-empty rows; they mark the end of a parent's children
+        parse_options=pacsv.ParseOptions(delimiter=delimiter, quote_char=quotechar,
+                                         newlines_in_values=True, ignore_empty_lines=False),
+        convert_options=pacsv.ConvertOptions(column_types={h: pa.string() for h in headers},
+                                             strings_can_be_null=False),
+    )
+    blank = [_arrow_blank(col) for col in table.columns]
+    empty = blank[0]
+    for mask in blank[1:]:
+        empty = pc.and_(empty, mask)
+    
+    # is_parent_row(): a bracketed number in both the first and the last column
+    first = _arrow_bracket_number(pc.utf8_trim_whitespace(table.column(0)), anchored=True)
+    last = _arrow_bracket_number(pc.utf8_trim_whitespace(table.column(len(headers) - 1)), anchored=True)
+    if len(headers) < 2:
+        is_parent = pa.repeat(False, table.num_rows)
+    else:
+        is_parent = pc.and_(pc.is_valid(first), pc.is_valid(last))
+    # Each parent starts a run and each separator row ends one (-1 marks "no parent")
+    markers = pc.if_else(is_parent, last, pc.if_else(empty, pa.scalar(-1, pa.int64()), pa.scalar(None, pa.int64())))
+    current = pc.fill_null_forward(markers)
+    current = pc.if_else(pc.equal(current, -1), pa.scalar(None, pa.int64()), current)
+    
+    columns = []
+    for h, col, mask in zip(headers, table.columns, blank):
+        col_type = column_types.get(h, "TEXT")
+        if col_type == "REAL":
+            # Raises on text float() would reject, sending the file down the csv path
+            col = pc.cast(pc.if_else(mask, None, pc.utf8_trim_whitespace(col)), pa.float64())
+        elif col_type == "INTEGER":
+            col = _arrow_bracket_number(col)
+        else:
+            col = pc.if_else(mask, None, col)
+        columns.append(col)
+    if "index" in headers:
+        # Child rows with an empty "index" take their parent's
+        index_col = headers.index("index")
+        fill = pc.and_(pc.invert(is_parent), blank[index_col])
+        columns[index_col] = pc.if_else(fill, current, columns[index_col])
+    columns.append(pc.if_else(is_parent, pa.scalar(None, pa.int64()), current))
+    
+    converted = pa.table(columns, names=headers + ["parent_index"]).filter(pc.invert(empty))
+    # Python objects are only built one batch at a time
+    return (row for batch in converted.to_batches(max_chunksize=65536)
+            for row in zip(*(col.to_pylist() for col in batch.columns)))
+
+
+def build_name_search_index(conn: sqlite3.Connection, table: str):
+    """(Re)build the "<table>_fts" trigram index over the name column.
+
+    The report tools answer substring searches (name LIKE '%...%') from it
+    instead of scanning every name.
+    """
+    fts = f"{table}_fts"
+    conn.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5('
+                 f'name, content=\'{table}\', content_rowid=\'rowid\', tokenize=\'trigram\')')
+    # External-content table: re-read every name, including rows appended by this run
+    conn.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+
+
+def _produce_batches(rows, batch_size: int, batches: queue.Queue, errors: list):
+    """Parser-thread body: put lists of up to batch_size rows on the queue, then a None sentinel."""
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                batches.put(batch)
+                batch = []
+        if batch:
+            batches.put(batch)
+    except BaseException as e:
+        # Re-raised by insert_rows on the main thread
+        errors.append(e)
+    finally:
+        batches.put(None)
+
+
+def insert_rows(conn: sqlite3.Connection, table: str, headers: List[str], column_types: Dict[str, str], rows_iter,
+                converted: bool = False, batch_size: int = 2000):
+    # Determine if parent_index exists to shape INSERT list
+    cols = get_table_columns(conn, table)
+    include_parent_index = 'parent_index' in cols
+    placeholders = ", ".join(["?"] * (len(headers) + (1 if include_parent_index else 0)))
+    cols_quoted = ", ".join([f'"{h}"' for h in headers])
+    if include_parent_index:
+        cols_quoted += ', "parent_index"'
+    sql = f'INSERT INTO "{table}" ({cols_quoted}) VALUES ({placeholders})'
+
+    # Parse and convert on a worker thread while this thread inserts; sqlite3
+    # releases the GIL inside executemany, so the two stages overlap
+    batches: queue.Queue = queue.Queue(maxsize=8)
+    errors: list = []
+    # read_rows_arrow() hands over rows that are already converted
+    rows = rows_iter if converted else _row_iter(rows_iter, headers, column_types, include_parent_index)
+    producer = threading.Thread(target=_produce_batches, args=(rows, batch_size, batches, errors), daemon=True)
+    producer.start()
+
+    # One cursor for every batch, so the same prepared INSERT is reused
+    cur = conn.cursor()
+    count = 0
+    try:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            cur.executemany(sql, batch)
             count += len(batch)
-            batch.clear()
-    if batch:
-        conn.executemany(sql, batch)
-        conn.commit()
-        count += len(batch)
+    finally:
+        cur.close()
+    producer.join()
+    if errors:
+        raise errors[0]
     return count
 
 
@@ -185,63 +422,121 @@ def main():
     parser.add_argument("--table", dest="table", default="gprof_cc", help="Destination table name (default: gprof_cc)")
     parser.add_argument("--delimiter", dest="delimiter", default=";", help="Field delimiter (default: ;)")
     parser.add_argument("--encoding", dest="encoding", default="utf-8", help="File encoding (default: utf-8)")
-    parser.add_argument("--batch-size", dest="batch", type=int, default=2000, help="Batch size for inserts (default: 2000)")
+    parser.add_argument("--batch-size", dest="batch", type=int, default=2000, help="Rows per batch handed from the parser thread to the inserter (default: 2000)")
     parser.add_argument("--quotechar", dest="quotechar", default='"', help='CSV quote char (default: ")')
+    # The arrow path is faster but holds the whole file in memory, so it is opt-in
+    parser.add_argument("--engine", dest="engine", choices=["auto", "arrow", "csv"], default="csv",
+                        help="CSV parser: the streaming csv module, pyarrow (several times faster, "
+                             "but loads the whole file into memory), or auto for pyarrow when "
+                             "installed (default: csv)")
 
     args = parser.parse_args()
 
     csv_path = os.path.abspath(args.csv_path)
     if not os.path.exists(csv_path):
         raise SystemExit(f"Input file not found: {csv_path}")
+    if args.engine == "arrow" and pacsv is None:
+        raise SystemExit("pyarrow is not installed; use --engine csv")
+    use_arrow = args.engine != "csv" and pacsv is not None
 
     db_path = os.path.abspath(args.db_path) if args.db_path else os.path.splitext(csv_path)[0] + ".sqlite"
     table = args.table
+    # Refuse names the query tool and viewer would reject later
+    try:
+        validate_table_identifier(table)
+    except ValueError as e:
+        raise SystemExit(str(e))
 
     # Create DB directory if needed
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
-    with sqlite3.connect(db_path) as conn, open(csv_path, "r", encoding=args.encoding, newline="") as f:
+    with sqlite3.connect(db_path) as conn, open(csv_path, "r", encoding=args.encoding, newline="", buffering=READ_BUFFER_SIZE) as f:
+        apply_bulk_load_pragmas(conn)
         reader = csv.reader(f, delimiter=args.delimiter, quotechar=args.quotechar)
-        headers = infer_headers(reader)
+        # Sanitize header names and infer column types from them in one pass
+        headers, column_types = infer_headers_and_types(reader)
         if not headers:
             raise SystemExit("CSV appears to be empty; no headers found.")
         
-        # Infer column types from header names
-        column_types = infer_column_types(headers)
+        rows = reader
+        converted = False
+        if use_arrow:
+            try:
+                rows = read_rows_arrow(csv_path, headers, column_types,
+                                       args.delimiter, args.quotechar, args.encoding)
+                converted = True
+            except pa.ArrowException as e:
+                # e.g. ragged rows, which the csv module pads or trims instead
+                print(f"pyarrow could not parse the CSV ({e}); falling back to the csv module")
         
         create_table(conn, table, headers, column_types)
         # If the table already existed, make sure parent_index column is present
         ensure_parent_index_column(conn, table)
-        total = insert_rows(conn, table, headers, column_types, reader, batch_size=args.batch)
+        ensure_cpu_sum_column(conn, table)
+        # Load everything in one transaction; the caller owns the commit
+        conn.execute("BEGIN")
+        total = insert_rows(conn, table, headers, column_types, rows, converted, batch_size=args.batch)
+        conn.execute("COMMIT")
         
         # Create useful indexes
+        # Indexes are only built after the load has committed, so inserts never maintain them
         print(f"Creating indexes...")
+        # Only a full set of indexes is recorded in user_version (see below)
+        indexes_complete = True
         # Index on name column for fast lookups
         try:
             conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_name_idx" ON "{table}"(name)')
         except sqlite3.DatabaseError:
-            pass
+            indexes_complete = False
         
         # Index on first index column if it exists
         if "index" in headers:
             try:
                 conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_index_idx" ON "{table}"("index")')
             except sqlite3.DatabaseError:
-                pass
+                indexes_complete = False
         
-        # Index on cpu_time_total for finding top entries
-        if "cpu_time_total" in headers:
+        # Index on cpu_time_total for finding top entries; when the usual report
+        # columns exist, make it covering so top-N queries never touch the table
+        cover_cols = ["name", "cpu_time_self", "cpu_time_children", "index"]
+        if "cpu_time_total" in headers and all(c in headers for c in cover_cols):
+            try:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_cpu_cover_idx" ON "{table}"'
+                             '(cpu_time_total DESC, name, cpu_time_self, cpu_time_children, "index")')
+            except sqlite3.DatabaseError:
+                indexes_complete = False
+        elif "cpu_time_total" in headers:
             try:
                 conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_cpu_total_idx" ON "{table}"(cpu_time_total DESC)')
             except sqlite3.DatabaseError:
-                pass
+                indexes_complete = False
+        
+        # Indexes on self/children time for the "high self time" and "expensive children" reports
+        for col, idx_name in (("cpu_time_self", "cpu_self"), ("cpu_time_children", "cpu_children")):
+            if col in headers:
+                try:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{idx_name}_idx" ON "{table}"({col} DESC)')
+                except sqlite3.DatabaseError:
+                    indexes_complete = False
         
         # Index on parent_index for finding children
         try:
             conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_parent_idx" ON "{table}"(parent_index)')
         except sqlite3.DatabaseError:
-            pass
+            indexes_complete = False
+        
+        # Trigram full-text index for name substring searches
+        try:
+            build_name_search_index(conn, table)
+        except sqlite3.DatabaseError:
+            indexes_complete = False
         
+        # Gather planner statistics once, after all indexes are built
+        conn.execute("ANALYZE")
+        # Tell query_gprof_db.py / view_gprof_db.py that their indexes already exist;
+        # after a failure the version stays put so their ensure_indexes() tries again
+        if indexes_complete:
+            conn.execute(f"PRAGMA user_version={INDEX_SCHEMA_VERSION}")
         conn.commit()
 
     print(f"Done. Inserted {total} rows into {db_path}, table '{table}'.")
@@ -4,87 +4,475 @@ Query and analyze gprof-cc SQLite database.
 Provides various useful analytics on profiling data.
 """
 import argparse
+import csv
+import hashlib
+import json
+import os
+import re
 import sqlite3
 import sys
-from typing import List, Tuple
+import time
+from itertools import chain, groupby, islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+# Bumped whenever ensure_indexes() gains indexes or columns; stored in PRAGMA user_version.
+# view_gprof_db.py and convert_gprof_csv_to_sqlite.py import it from here.
+INDEX_SCHEMA_VERSION = 3
+
+# On-disk report cache; CACHE_DB_PATH is set in main() unless --no-cache is given
+_CACHE_DIR = Path("~/.cache/gprof_query").expanduser()
+CACHE_DB_PATH = None
+# Entries older than a week, or beyond 64 MiB in total (oldest first), are pruned
+CACHE_MAX_AGE = 7 * 24 * 3600
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Results longer than this stream through uncached rather than being held in memory
+CACHE_MAX_ROWS = 10000
+
+# Whether the table has a parent_index column; checked once in main()
+HAS_PARENT_INDEX = True
+# Whether the table has the generated cpu_sum column; checked once in main()
+HAS_CPU_SUM = True
+# Whether the <table>_fts name search index exists; checked once in main()
+HAS_NAME_INDEX = True
+
+# Output format from --format; "csv"/"tsv" write bare rows for other tools
+OUTPUT_FORMAT = "table"
+CSV_DIALECTS = {"csv": "excel", "tsv": "excel-tab"}
+
+# Query templates live at module level and are formatted for the table once
+# (build_queries), so repeated calls hit sqlite3's prepared-statement cache
+# instead of re-preparing.
+SQL_TOP_CPU = """
+    SELECT
+        name,
+        ROUND(cpu_time_total, 2) as pct_total,
+        ROUND(cpu_time_self, 2) as time_self,
+        ROUND(cpu_time_children, 2) as time_children,
+        "index"
+    FROM "{table}"
+    WHERE cpu_time_total IS NOT NULL
+    ORDER BY cpu_time_total DESC
+    LIMIT ?
+"""
+
+SQL_HIGH_SELF_TIME = """
+    SELECT
+        name,
+        ROUND(cpu_time_self, 2) as time_self,
+        ROUND(cpu_time_total, 2) as pct_total,
+        ROUND(cpu_time_children, 2) as time_children,
+        ROUND(100.0 * cpu_time_self / NULLIF(cpu_time_total, 0), 1) as self_pct
+    FROM "{table}"
+    WHERE cpu_time_self > ?
+    ORDER BY cpu_time_self DESC
+    LIMIT ?
+"""
+
+# {name_match} looks names up in the <table>_fts trigram index, which answers
+# LIKE '%...%' itself, or is a plain name LIKE (see name_match_sql).
+# SQLite sorts NULLs last under DESC, so the
+# ORDER BY cpu_time_total DESC here and in SQL_CYCLES keeps untimed rows at
+# the end without a NULLS LAST clause.
+SQL_SEARCH = """
+    SELECT
+        name,
+        ROUND(cpu_time_total, 2) as pct_total,
+        ROUND(cpu_time_self, 2) as time_self,
+        "index"
+    FROM "{table}"
+    WHERE {name_match}
+    ORDER BY cpu_time_total DESC
+    LIMIT ?
+"""
+
+SQL_STATISTICS = """
+    SELECT
+        COUNT(*) as total_entries,
+        COUNT(CASE WHEN cpu_time_total IS NOT NULL THEN 1 END) as with_timing,
+        ROUND(AVG(cpu_time_total), 4) as avg_pct_total,
+        ROUND(MAX(cpu_time_total), 2) as max_pct_total,
+        ROUND(SUM(cpu_time_self), 2) as total_self_time,
+        ROUND(AVG(cpu_time_self), 4) as avg_self_time
+    FROM "{table}"
+"""
+
+SQL_CYCLES = """
+    SELECT
+        name,
+        ROUND(cpu_time_total, 2) as pct_total,
+        ROUND(cpu_time_self, 2) as time_self,
+        "index"
+    FROM "{table}"
+    WHERE {cycle_match}
+    ORDER BY cpu_time_total DESC
+    LIMIT 20
+"""
+
+SQL_EXPENSIVE_CHILDREN = """
+    SELECT
+        name,
+        ROUND(cpu_time_children, 2) as time_children,
+        ROUND(cpu_time_self, 2) as time_self,
+        ROUND(cpu_time_total, 2) as pct_total,
+        ROUND(100.0 * cpu_time_children / NULLIF(cpu_time_total, 0), 1) as children_pct
+    FROM "{table}"
+    WHERE cpu_time_children IS NOT NULL
+    ORDER BY cpu_time_children DESC
+    LIMIT ?
+"""
+
+# The --all reports and their column counts, in output order
+ALL_REPORTS = (
+    ("stats", 6),
+    ("top", 5),
+    ("self", 5),
+    ("children", 5),
+    ("cycles", 4),
+)
+
+# Parents joined to their children in one statement; the caller groups rows by
+# the first six (parent) columns.  GROUP BY keeps the DISTINCT-parent semantics
+# on the rounded values while exposing the raw total for ordering.
+SQL_PARENTS_WITH_CHILDREN = """
+    WITH parents AS (
+        SELECT "index", name,
+               ROUND(cpu_time_total, 2) as pct_total,
+               ROUND(cpu_time_self, 2) as time_self,
+               ROUND(cpu_time_children, 2) as time_children,
+               ROUND({cpu_sum}, 2) as total_time,
+               MAX(cpu_time_total) as sort_total
+        FROM "{table}"
+        WHERE parent_index IS NULL
+          AND {name_match}
+        GROUP BY 1, 2, 3, 4, 5, 6
+    )
+    SELECT p."index", p.name, p.pct_total, p.time_self, p.time_children, p.total_time,
+           c.rowid,
+           c."index_1" as child_index, c.name,
+           ROUND(c.cpu_time_total, 2),
+           ROUND(c.cpu_time_self, 2),
+           ROUND(c.cpu_time_children, 2),
+           ROUND({child_cpu_sum}, 2)
+    FROM parents p
+    LEFT JOIN "{table}" c ON c.parent_index = p."index"
+    ORDER BY p.sort_total DESC, 1, 2, 3, 4, 5, 6,
+             {child_cpu_sum} DESC
+"""
+
+SQL_PARENTS_WITH_CHILDREN_NO_PARENT_INDEX = """
+    WITH parents AS (
+        SELECT "index", name,
+               ROUND(cpu_time_total, 2) as pct_total,
+               ROUND(cpu_time_self, 2) as time_self,
+               ROUND(cpu_time_children, 2) as time_children,
+               ROUND({cpu_sum}, 2) as total_time,
+               MAX(cpu_time_total) as sort_total
+        FROM "{table}"
+        WHERE "index" IS NOT NULL
+          AND "index" = "index_1"
+          AND {name_match}
+        GROUP BY 1, 2, 3, 4, 5, 6
+    )
+    SELECT p."index", p.name, p.pct_total, p.time_self, p.time_children, p.total_time,
+           c.rowid,
+           c."index_1" as child_index, c.name,
+           ROUND(c.cpu_time_total, 2),
+           ROUND(c.cpu_time_self, 2),
+           ROUND(c.cpu_time_children, 2),
+           ROUND({child_cpu_sum}, 2)
+    FROM parents p
+    LEFT JOIN "{table}" c ON c."index" = p."index" AND c."index" != c."index_1"
+    ORDER BY p.sort_total DESC, 1, 2, 3, 4, 5, 6,
+             {child_cpu_sum} DESC
+"""
+
+
+# Every template by query name; build_queries() fills in the table
+QUERY_TEMPLATES = {
+    "stats": SQL_STATISTICS,
+    "top": SQL_TOP_CPU,
+    "self": SQL_HIGH_SELF_TIME,
+    "children": SQL_EXPENSIVE_CHILDREN,
+    "cycles": SQL_CYCLES,
+    "search": SQL_SEARCH,
+    "parents": SQL_PARENTS_WITH_CHILDREN,
+    "parents_no_parent_index": SQL_PARENTS_WITH_CHILDREN_NO_PARENT_INDEX,
+}
+
+# Name searches also get a "<name>_like" variant for patterns the trigram index cannot serve
+LIKE_VARIANTS = ("search", "parents", "parents_no_parent_index")
+
+# Query text for the validated table, built once in main()
+QUERIES = {}
+
+
+def cpu_sum_expr(has_cpu_sum: bool, alias: str = "") -> str:
+    """SQL for self + children time: the cpu_sum column, or the same sum inline when it is missing."""
+    if has_cpu_sum:
+        return f"{alias}cpu_sum"
+    # Older databases opened read-only never gained the column from ensure_indexes()
+    return f"(COALESCE({alias}cpu_time_self, 0) + COALESCE({alias}cpu_time_children, 0))"
+
+
+def name_match_sql(table: str, use_index: bool, pattern: str = "?") -> str:
+    """SQL matching name LIKE ``pattern``, through the <table>_fts trigram index when ``use_index``."""
+    if use_index:
+        return f'rowid IN (SELECT rowid FROM "{table}_fts" WHERE name LIKE {pattern})'
+    return f"name LIKE {pattern}"
+
+
+def trigram_searchable(pattern: str) -> bool:
+    """Whether the trigram index can answer LIKE '%pattern%'.
+
+    It needs at least three consecutive characters that are not LIKE wildcards.
+    """
+    return re.search(r"[^%_]{3}", pattern) is not None
+
+
+def has_name_index(conn: sqlite3.Connection, table: str) -> bool:
+    """Whether the <table>_fts name search index exists (read-only databases may lack it)."""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"{table}_fts",)).fetchone() is not None
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> set:
+    """Return the column names of ``table``, including generated columns."""
+    # Generated columns are hidden from table_info, so look in table_xinfo
+    return {row[1] for row in conn.execute(f'PRAGMA table_xinfo("{table}")')}
+
+
+def build_queries(table: str, has_cpu_sum: bool = True, use_name_index: bool = True) -> dict:
+    """Format every query template for ``table``, plus the combined --all statement."""
+    def fill(sql: str, use_index: bool) -> str:
+        return sql.format(table=table, cpu_sum=cpu_sum_expr(has_cpu_sum),
+                          child_cpu_sum=cpu_sum_expr(has_cpu_sum, "c."),
+                          name_match=name_match_sql(table, use_index),
+                          cycle_match=name_match_sql(table, use_index, "'%cycle%'"))
+    
+    queries = {name: fill(sql, use_name_index) for name, sql in QUERY_TEMPLATES.items()}
+    queries.update({f"{name}_like": fill(QUERY_TEMPLATES[name], False) for name in LIKE_VARIANTS})
+    # Each --all branch is tagged with its report name and padded to the
+    # widest (statistics) row
+    queries["all"] = "\nUNION ALL\n".join(
+        f"SELECT '{tag}', *{', NULL' * (6 - ncols)} FROM ({queries[tag]})" for tag, ncols in ALL_REPORTS
+    )
+    return queries
+
+
+def validate_table_identifier(table: str):
+    """Raise ValueError unless ``table`` is a plain identifier safe to put into SQL text."""
+    if not re.fullmatch(r"[A-Za-z0-9_]+", table):
+        raise ValueError(f"Invalid table name '{table}': use letters, digits and underscores")
+
+
+def validate_table_name(conn: sqlite3.Connection, table: str):
+    """Raise ValueError unless ``table`` is a plain identifier naming an existing table."""
+    validate_table_identifier(table)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is None:
+        raise ValueError(f"No table named '{table}' in the database")
+
+
+def ensure_indexes(conn: sqlite3.Connection, table: str):
+    """Create the indexes, cpu_sum column and name search index the report queries use.
+
+    PRAGMA user_version records that they exist, so later runs skip the DDL; it
+    is only bumped once every statement has succeeded.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= INDEX_SCHEMA_VERSION:
+        return
+    columns = table_columns(conn, table)
+    fts = f"{table}_fts"
+    ddls = [
+        f'CREATE INDEX IF NOT EXISTS "{table}_cpu_total_idx" ON "{table}"(cpu_time_total DESC)',
+        f'CREATE INDEX IF NOT EXISTS "{table}_cpu_self_idx" ON "{table}"(cpu_time_self DESC)',
+        f'CREATE INDEX IF NOT EXISTS "{table}_cpu_children_idx" ON "{table}"(cpu_time_children DESC)',
+        f'CREATE INDEX IF NOT EXISTS "{table}_name_idx" ON "{table}"(name)',
+        # Trigram full-text index answering name LIKE '%...%' searches
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5('
+        f"name, content='{table}', content_rowid='rowid', tokenize='trigram')",
+        f"INSERT INTO \"{fts}\"(\"{fts}\") VALUES ('rebuild')",
+        "ANALYZE",
+    ]
+    if "parent_index" in columns:
+        ddls.insert(3, f'CREATE INDEX IF NOT EXISTS "{table}_parent_idx" ON "{table}"(parent_index)')
+    if "cpu_sum" not in columns:
+        # Databases converted before cpu_sum existed; ALTER TABLE can only add VIRTUAL
+        ddls.insert(0, f'ALTER TABLE "{table}" ADD COLUMN cpu_sum REAL GENERATED ALWAYS AS '
+                       '(COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0)) VIRTUAL')
+    complete = True
+    for ddl in ddls:
+        try:
+            conn.execute(ddl)
+        except sqlite3.DatabaseError:
+            # e.g. a read-only file (older databases then need one writable
+            # open to gain cpu_sum and the search index)
+            complete = False
+    if complete:
+        conn.execute(f"PRAGMA user_version={INDEX_SCHEMA_VERSION}")
+
+
+def run_query(conn: sqlite3.Connection, sql: str, params: Tuple = ()) -> Iterable[Tuple]:
+    """Execute a report query, serving its rows from the on-disk cache when enabled.
+
+    Entries are keyed by database path, the modification time and size of the
+    database and of its -wal file, the SQL text and the parameters, so any
+    committed write invalidates them (in WAL mode commits may only touch -wal).
+    On a miss the rows stream from the cursor and are written out once exhausted.
+    """
+    if CACHE_DB_PATH is None:
+        return conn.execute(sql, params)
+    
+    try:
+        st = os.stat(CACHE_DB_PATH)
+    except OSError:
+        return conn.execute(sql, params)
+    try:
+        wal = os.stat(CACHE_DB_PATH + "-wal")
+        wal_ident = f"{wal.st_mtime_ns}:{wal.st_size}"
+    except OSError:
+        wal_ident = "-"
+    ident = f"{os.path.abspath(CACHE_DB_PATH)}:{st.st_mtime_ns}:{st.st_size}:{wal_ident}:{sql}:{params!r}"
+    path = _CACHE_DIR / f"{hashlib.blake2b(ident.encode()).hexdigest()}.json"
+    
+    try:
+        return [tuple(row) for row in json.loads(path.read_bytes())]
+    except (OSError, ValueError):
+        pass
+    
+    return _stream_and_cache(conn.execute(sql, params), path)
+
+
+def _stream_and_cache(cursor: sqlite3.Cursor, path: Path) -> Iterable[Tuple]:
+    """Yield ``cursor``'s rows, saving them to the cache entry ``path`` once all have been read.
+
+    Only the first CACHE_MAX_ROWS rows are kept; a longer result is not cached.
+    """
+    rows = []
+    for row in cursor:
+        if rows is not None:
+            if len(rows) < CACHE_MAX_ROWS:
+                rows.append(row)
+            else:
+                rows = None
+        yield row
+    
+    if rows is None:
+        return
+    try:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(json.dumps(rows).encode())
+        os.replace(tmp, path)
+        prune_cache()
+    except OSError:
+        pass  # The cache is best-effort
+
+
+def prune_cache():
+    """Drop cache entries older than CACHE_MAX_AGE, then the oldest beyond CACHE_MAX_BYTES."""
+    now = time.time()
+    entries = []
+    for entry in os.scandir(_CACHE_DIR):
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        if now - st.st_mtime > CACHE_MAX_AGE:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+        else:
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(entry_path)
+        except OSError:
+            pass
+        total -= size
 
 
 def print_section(title: str):
     """Print a formatted section header."""
+    if OUTPUT_FORMAT != "table":
+        return
     print(f"\n{'='*70}")
     print(f"  {title}")
     print(f"{'='*70}\n")
 
 
-def print_table(headers: List[str], rows: List[Tuple], widths: List[int] = None):
-    """Print results in a formatted table."""
-    if not rows:
-        print("(No results)")
+def print_table(headers: List[str], rows: Iterable[Tuple], widths: List[int] = None,
+                max_rows: int = 10000):
+    """Print results in a formatted table.
+
+    ``rows`` may be any iterable, including a live cursor, and is streamed.
+    Auto-calculated widths are sized from at most the first ``max_rows`` rows.
+    With --format csv/tsv the header and rows go straight to csv.writer.
+    """
+    if OUTPUT_FORMAT != "table":
+        writer = csv.writer(sys.stdout, dialect=CSV_DIALECTS[OUTPUT_FORMAT], lineterminator="\n")
+        writer.writerow(headers)
+        writer.writerows(rows)
         return
     
+    rows = iter(rows)
+    
     # Auto-calculate widths if not provided
     if widths is None:
+        # Stringify the sample once; the render step below reuses these strings
+        buffered = [tuple(map(str, row)) for row in islice(rows, max_rows)]
         widths = [len(h) for h in headers]
-        for row in rows:
-            for i, val in enumerate(row):
-                widths[i] = max(widths[i], len(str(val)))
+        for i, col in enumerate(zip(*buffered)):
+            widths[i] = max(widths[i], max(map(len, col)))
+        rows = chain(buffered, rows)
+    
+    first = next(rows, None)
+    if first is None:
+        print("(No results)")
+        return
     
     # Print header
     header_line = " | ".join(h.ljust(widths[i]) for i, h in enumerate(headers))
     print(header_line)
     print("-" * len(header_line))
     
-    # Print rows
-    for row in rows:
-        print(" | ".join(str(val).ljust(widths[i]) for i, val in enumerate(row)))
+    # Print rows: one precomputed format string, written in chunks of lines
+    fmt = " | ".join("{:<" + str(w) + "}" for w in widths)
+    rows = chain((first,), rows)
+    while True:
+        lines = [fmt.format(*map(str, row)) for row in islice(rows, 1000)]
+        if not lines:
+            break
+        lines.append("")
+        sys.stdout.write("\n".join(lines))
 
 
-def query_top_cpu_consumers(conn: sqlite3.Connection, limit: int = 20):
+def query_top_cpu_consumers(conn: sqlite3.Connection, limit: int = 20, rows: Iterable[Tuple] = None):
     """Find functions with highest total CPU time."""
     print_section(f"Top {limit} CPU Time Consumers")
     
-    cursor = conn.execute("""
-        SELECT 
-            name,
-            ROUND(cpu_time_total, 2) as pct_total,
-            ROUND(cpu_time_self, 2) as time_self,
-            ROUND(cpu_time_children, 2) as time_children,
-            "index"
-        FROM gprof_cc
-        WHERE cpu_time_total IS NOT NULL
-        ORDER BY cpu_time_total DESC
-        LIMIT ?
-    """, (limit,))
-    
-    rows = cursor.fetchall()
+    cursor = rows if rows is not None else run_query(conn, QUERIES["top"], (limit,))
+    
     print_table(
         ["Function Name", "% Total", "Self Time", "Children Time", "Index"],
-        rows,
+        cursor,
         [50, 10, 12, 15, 8]
     )
 
 
-def query_high_self_time(conn: sqlite3.Connection, threshold: float = 0.5, limit: int = 15):
+def query_high_self_time(conn: sqlite3.Connection, threshold: float = 0.5, limit: int = 15, rows: Iterable[Tuple] = None):
     """Find functions spending significant time in their own code (not children)."""
     print_section(f"Functions with Self-Time > {threshold} (Top {limit})")
     
-    cursor = conn.execute("""
-        SELECT 
-            name,
-            ROUND(cpu_time_self, 2) as time_self,
-            ROUND(cpu_time_total, 2) as pct_total,
-            ROUND(cpu_time_children, 2) as time_children,
-            ROUND(100.0 * cpu_time_self / NULLIF(cpu_time_total, 0), 1) as self_pct
-        FROM gprof_cc
-        WHERE cpu_time_self > ?
-        ORDER BY cpu_time_self DESC
-        LIMIT ?
-    """, (threshold, limit))
-    
-    rows = cursor.fetchall()
+    cursor = rows if rows is not None else run_query(conn, QUERIES["self"], (threshold, limit))
+    
     print_table(
         ["Function Name", "Self Time", "% Total", "Children Time", "Self %"],
-        rows,
+        cursor,
         [50, 12, 10, 15, 8]
     )
 
@@ -93,42 +481,24 @@ def search_functions(conn: sqlite3.Connection, pattern: str, limit: int = 20):
     """Search for functions by name pattern."""
     print_section(f"Functions matching '{pattern}' (Top {limit})")
     
-    cursor = conn.execute("""
-        SELECT 
-            name,
-            ROUND(cpu_time_total, 2) as pct_total,
-            ROUND(cpu_time_self, 2) as time_self,
-            "index"
-        FROM gprof_cc
-        WHERE name LIKE ?
-        ORDER BY cpu_time_total DESC NULLS LAST
-        LIMIT ?
-    """, (f"%{pattern}%", limit))
-    
-    rows = cursor.fetchall()
+    query = QUERIES["search" if trigram_searchable(pattern) else "search_like"]
+    cursor = run_query(conn, query, (f"%{pattern}%", limit))
+    
     print_table(
         ["Function Name", "% Total", "Self Time", "Index"],
-        rows,
+        cursor,
         [55, 10, 12, 8]
     )
 
 
-def query_statistics(conn: sqlite3.Connection):
+def query_statistics(conn: sqlite3.Connection, rows: Iterable[Tuple] = None):
     """Show statistical summary of profiling data."""
     print_section("Statistical Summary")
     
-    cursor = conn.execute("""
-        SELECT 
-            COUNT(*) as total_entries,
-            COUNT(CASE WHEN cpu_time_total IS NOT NULL THEN 1 END) as with_timing,
-            ROUND(AVG(cpu_time_total), 4) as avg_pct_total,
-            ROUND(MAX(cpu_time_total), 2) as max_pct_total,
-            ROUND(SUM(cpu_time_self), 2) as total_self_time,
-            ROUND(AVG(cpu_time_self), 4) as avg_self_time
-        FROM gprof_cc
-    """)
-    
-    row = cursor.fetchone()
+    cursor = rows if rows is not None else run_query(conn, QUERIES["stats"])
+    
+    # Unpacking reads the cursor to the end, so the one row gets cached
+    (row,) = cursor
     labels = [
         "Total Entries:",
         "Entries with Timing:",
@@ -138,137 +508,91 @@ def query_statistics(conn: sqlite3.Connection):
         "Avg Self Time:"
     ]
     
+    if OUTPUT_FORMAT != "table":
+        print_table(["Statistic", "Value"], zip((label.rstrip(":") for label in labels), row))
+        return
+    
     for label, value in zip(labels, row):
         print(f"{label:25} {value}")
 
 
-def query_cycles(conn: sqlite3.Connection):
+def query_cycles(conn: sqlite3.Connection, rows: Iterable[Tuple] = None):
     """Find cycle-related entries."""
     print_section("Call Cycles Detected")
     
-    cursor = conn.execute("""
-        SELECT 
-            name,
-            ROUND(cpu_time_total, 2) as pct_total,
-            ROUND(cpu_time_self, 2) as time_self,
-            "index"
-        FROM gprof_cc
-        WHERE name LIKE '%cycle%'
-        ORDER BY cpu_time_total DESC NULLS LAST
-        LIMIT 20
-    """)
-    
-    rows = cursor.fetchall()
-    if rows:
+    cursor = iter(rows if rows is not None else run_query(conn, QUERIES["cycles"]))
+    
+    first = next(cursor, None)
+    if first is not None or OUTPUT_FORMAT != "table":
         print_table(
             ["Function Name", "% Total", "Self Time", "Index"],
-            rows,
+            chain((first,), cursor) if first is not None else (),
             [55, 10, 12, 8]
         )
     else:
         print("(No cycles detected)")
 
 
-def query_expensive_children(conn: sqlite3.Connection, limit: int = 15):
+def query_expensive_children(conn: sqlite3.Connection, limit: int = 15, rows: Iterable[Tuple] = None):
     """Find functions whose children consume most time (coordination/framework functions)."""
     print_section(f"Functions with Expensive Children (Top {limit})")
     
-    cursor = conn.execute("""
-        SELECT 
-            name,
-            ROUND(cpu_time_children, 2) as time_children,
-            ROUND(cpu_time_self, 2) as time_self,
-            ROUND(cpu_time_total, 2) as pct_total,
-            ROUND(100.0 * cpu_time_children / NULLIF(cpu_time_total, 0), 1) as children_pct
-        FROM gprof_cc
-        WHERE cpu_time_children IS NOT NULL
-        ORDER BY cpu_time_children DESC
-        LIMIT ?
-    """, (limit,))
-    
-    rows = cursor.fetchall()
+    cursor = rows if rows is not None else run_query(conn, QUERIES["children"], (limit,))
+    
     print_table(
         ["Function Name", "Children Time", "Self Time", "% Total", "Children %"],
-        rows,
+        cursor,
         [50, 15, 12, 10, 12]
     )
 
 
+def query_all(conn: sqlite3.Connection):
+    """Run the standard reports (--all) as a single statement and print each one."""
+    results = {tag: [] for tag, _ in ALL_REPORTS}
+    ncols = dict(ALL_REPORTS)
+    for row in run_query(conn, QUERIES["all"], (15, 0.5, 10, 10)):
+        results[row[0]].append(row[1:1 + ncols[row[0]]])
+    
+    query_statistics(conn, rows=results["stats"])
+    query_top_cpu_consumers(conn, limit=15, rows=results["top"])
+    query_high_self_time(conn, threshold=0.5, limit=10, rows=results["self"])
+    query_expensive_children(conn, limit=10, rows=results["children"])
+    query_cycles(conn, rows=results["cycles"])
+
+
 def query_parent_and_children(conn: sqlite3.Connection, pattern: str):
     """Display parent functions matching pattern along with their children."""
     print_section(f"Parents matching '{pattern}' with their children")
     
-    # Check if parent_index column exists
-    cursor = conn.execute("PRAGMA table_info(gprof_cc)")
-    columns = {row[1] for row in cursor.fetchall()}
-    has_parent_index = 'parent_index' in columns
-    
-    # Find parent functions matching the pattern
-    if has_parent_index:
-        parent_query = """
-            SELECT DISTINCT "index", name, 
-                   ROUND(cpu_time_total, 2) as pct_total,
-                   ROUND(cpu_time_self, 2) as time_self,
-                   ROUND(cpu_time_children, 2) as time_children,
-                   ROUND(COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0), 2) as total_time
-            FROM gprof_cc
-            WHERE parent_index IS NULL 
-              AND name LIKE ?
-            ORDER BY cpu_time_total DESC NULLS LAST
-        """
+    # Parents and their children come back in one ordered result set
+    if HAS_PARENT_INDEX:
+        name = "parents"
     else:
-        parent_query = """
-            SELECT DISTINCT "index", name,
-                   ROUND(cpu_time_total, 2) as pct_total,
-                   ROUND(cpu_time_self, 2) as time_self,
-                   ROUND(cpu_time_children, 2) as time_children,
-                   ROUND(COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0), 2) as total_time
-            FROM gprof_cc
-            WHERE "index" IS NOT NULL 
-              AND "index" = "index_1"
-              AND name LIKE ?
-            ORDER BY cpu_time_total DESC NULLS LAST
-        """
+        name = "parents_no_parent_index"
+    if not trigram_searchable(pattern):
+        name += "_like"
+    query = QUERIES[name]
     
-    cursor = conn.execute(parent_query, (f"%{pattern}%",))
-    parents = cursor.fetchall()
+    cursor = run_query(conn, query, (f"%{pattern}%",))
     
-    if not parents:
-        print(f"(No parent functions matching '{pattern}')")
+    if OUTPUT_FORMAT != "table":
+        # One flat row per child, prefixed with its parent
+        print_table(
+            ["Parent Index", "Parent Name", "Index", "Function Name", "% Total", "Self", "Children", "Total"],
+            (tuple(row[:2]) + tuple(row[7:]) for row in cursor if row[6] is not None)
+        )
         return
     
+    found_parents = False
     # Track if we displayed any parents (ones with children)
     displayed_count = 0
     
-    for parent in parents:
+    for parent, group in groupby(cursor, key=itemgetter(0, 1, 2, 3, 4, 5)):
+        found_parents = True
         parent_index, parent_name, pct_total, time_self, time_children, total_time = parent
         
-        # Get children of this parent first to see if we should display this parent
-        if has_parent_index:
-            children_query = """
-                SELECT "index_1" as child_index, name,
-                       ROUND(cpu_time_total, 2) as pct_total,
-                       ROUND(cpu_time_self, 2) as time_self,
-                       ROUND(cpu_time_children, 2) as time_children,
-                       ROUND(COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0), 2) as total_time
-                FROM gprof_cc
-                WHERE parent_index = ?
-                ORDER BY COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0) DESC
-            """
-        else:
-            children_query = """
-                SELECT "index_1" as child_index, name,
-                       ROUND(cpu_time_total, 2) as pct_total,
-                       ROUND(cpu_time_self, 2) as time_self,
-                       ROUND(cpu_time_children, 2) as time_children,
-                       ROUND(COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0), 2) as total_time
-                FROM gprof_cc
-                WHERE "index" = ? AND "index" != "index_1"
-                ORDER BY COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0) DESC
-            """
-        
-        cursor = conn.execute(children_query, (parent_index,))
-        children = cursor.fetchall()
+        # A parent without children comes back once, with a NULL child rowid
+        children = [row[7:] for row in group if row[6] is not None]
         
         # Only display parents that have children
         if children:
@@ -286,6 +610,10 @@ def query_parent_and_children(conn: sqlite3.Connection, pattern: str):
             )
             print()  # Extra spacing between parent groups
     
+    if not found_parents:
+        print(f"(No parent functions matching '{pattern}')")
+        return
+    
     if displayed_count == 0:
         print(f"(No parent functions matching '{pattern}' have children)")
 
@@ -312,18 +640,54 @@ Examples:
     parser.add_argument("--children", type=int, metavar="N", help="Show top N functions by children time")
     parser.add_argument("--parent", type=str, metavar="PATTERN", help="Show parent(s) matching pattern with their children")
     parser.add_argument("--table", type=str, default="gprof_cc", help="Table name (default: gprof_cc)")
+    parser.add_argument("--format", choices=["table", "csv", "tsv"], default="table",
+                        help="Output format; csv/tsv print the bare rows of a single report for other tools "
+                             "(default: table)")
+    parser.add_argument("--no-cache", action="store_true", help=f"Do not read or write cached results in {_CACHE_DIR}")
     
     args = parser.parse_args()
     
+    # csv/tsv carry one header row, so reports with different columns cannot share a stream
+    reports = [args.top, args.self_time is not None, args.search,
+               args.stats, args.cycles, args.children, args.parent]
+    if args.format != "table" and (args.all or sum(map(bool, reports)) != 1):
+        print(f"Error: --format {args.format} needs exactly one report option other than --all",
+              file=sys.stderr)
+        return 1
+    
     try:
-        conn = sqlite3.connect(args.db_path)
+        conn = sqlite3.connect(args.db_path, cached_statements=512, isolation_level=None)
+        # Read-heavy scans: memory-map up to 256 MiB and keep a 64 MiB page cache
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")
     except sqlite3.Error as e:
         print(f"Error opening database: {e}", file=sys.stderr)
         return 1
     
+    # Only a plain identifier naming an existing table is ever put into SQL text
+    try:
+        validate_table_name(conn, args.table)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        conn.close()
+        return 1
+    
     # Set table name globally (simple approach for this script)
     global TABLE_NAME
     TABLE_NAME = args.table
+    ensure_indexes(conn, TABLE_NAME)
+    
+    global HAS_PARENT_INDEX, HAS_CPU_SUM, HAS_NAME_INDEX
+    columns = table_columns(conn, TABLE_NAME)
+    HAS_PARENT_INDEX = 'parent_index' in columns
+    HAS_CPU_SUM = 'cpu_sum' in columns
+    HAS_NAME_INDEX = has_name_index(conn, TABLE_NAME)
+    QUERIES.update(build_queries(TABLE_NAME, HAS_CPU_SUM, HAS_NAME_INDEX))
+    
+    global CACHE_DB_PATH, OUTPUT_FORMAT
+    OUTPUT_FORMAT = args.format
+    if not args.no_cache:
+        CACHE_DB_PATH = args.db_path
     
     try:
         # If no specific query specified, show defaults
@@ -332,11 +696,7 @@ Examples:
             args.all = True
         
         if args.all:
-            query_statistics(conn)
-            query_top_cpu_consumers(conn, limit=15)
-            query_high_self_time(conn, threshold=0.5, limit=10)
-            query_expensive_children(conn, limit=10)
-            query_cycles(conn)
+            query_all(conn)
         else:
             if args.stats:
                 query_statistics(conn)
@@ -3,17 +3,74 @@
 Web-based viewer for gprof SQLite databases with clickable index links.
 """
 import argparse
+import gzip
 import sqlite3
 import html
-from flask import Flask, request, render_template_string
+import queue
+from flask import Flask, g, request
+from markupsafe import Markup
 import sys
 
+# Index/schema upkeep and table validation are shared with the query tool
+from query_gprof_db import (cpu_sum_expr, ensure_indexes, has_name_index, name_match_sql, table_columns,
+                            trigram_searchable, validate_table_name)
+
+# Optional: waitress serves requests from a pool of worker threads
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
+
+# Optional: flask_compress gzips responses; gzip_response() below stands in for it
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
 app = Flask(__name__)
 
 # Global variable to store database path
 DB_PATH = None
 TABLE_NAME = "gprof_cc"
 
+# Request threads when served by waitress
+WORKER_THREADS = 8
+
+# Idle tuned connections shared by all request threads (see get_conn).  The
+# development server starts a new thread per request, so per-thread
+# connections would never be reused; at most POOL_SIZE idle ones are kept.
+POOL_SIZE = WORKER_THREADS
+_pool = queue.Queue(maxsize=POOL_SIZE)
+
+# Applied once to each new connection; WAL lets concurrent readers proceed
+# and mmap serves hot pages without read() syscalls
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA synchronous=NORMAL",
+)
+
+# Count and row SQL for every (view, search) pair, built once per table by
+# build_view_queries() so each request reuses a statement from sqlite3's cache.  search is
+# None, "index" (through the trigram index) or "like" (patterns the index cannot serve)
+VIEW_QUERIES = {}
+
+# WHERE filter and ORDER BY for each view; "children" is the single-index view
+VIEW_FILTERS = {
+    "all": None,
+    "parents": "parent_index IS NULL",
+    "top_cpu": "cpu_time_total IS NOT NULL",
+    "children": "(\"index\" = ? OR parent_index = ?)",
+}
+VIEW_ORDERS = {
+    "all": "ORDER BY ROWID",
+    "parents": "ORDER BY ROWID",
+    "top_cpu": "ORDER BY cpu_time_total DESC",
+    "children": "ORDER BY CASE WHEN \"index\" = ? THEN 0 ELSE 1 END, ROWID",
+}
+
 # HTML template with embedded CSS
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -189,25 +246,7 @@ HTML_TEMPLATE = """
             </tr>
         </thead>
         <tbody>
-            {% for row in rows %}
-            <tr class="{% if row.is_parent %}parent-row{% elif row.parent_index %}child-row{% endif %}">
-                <td>
-                    {% if row.index %}
-                    <a href="?index={{ row.index }}&view=children" class="index-link">[{{ row.index }}]</a>
-                    {% endif %}
-                </td>
-                <td class="right-align">{{ "%.2f"|format(row.cpu_time_total) if row.cpu_time_total else "" }}</td>
-                <td class="right-align">{{ "%.6f"|format(row.cpu_time_self) if row.cpu_time_self else "" }}</td>
-                <td class="right-align">{{ "%.6f"|format(row.cpu_time_children) if row.cpu_time_children else "" }}</td>
-                <td class="right-align">{{ "%.6f"|format(row.cpu_sum) if row.cpu_sum else "" }}</td>
-                <td>{{ row.name }}</td>
-                <td>
-                    {% if row.parent_index %}
-                    <a href="?index={{ row.parent_index }}&view=children" class="index-link">[{{ row.parent_index }}]</a>
-                    {% endif %}
-                </td>
-            </tr>
-            {% endfor %}
+            {{ tbody }}
         </tbody>
     </table>
     {% else %}
@@ -217,12 +256,136 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# Compile the template once at import instead of on every request
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.jinja_env.auto_reload = False
+COMPILED_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+# Table pages compress several-fold; level 1 keeps the CPU cost low
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 1
+
+if Compress is not None:
+    app.config["COMPRESS_MIN_SIZE"] = COMPRESS_MIN_SIZE
+    app.config["COMPRESS_LEVEL"] = COMPRESS_LEVEL
+    Compress(app)
+else:
+    @app.after_request
+    def gzip_response(response):
+        """Gzip sizeable responses for clients that accept it."""
+        response.vary.add("Accept-Encoding")
+        if (response.direct_passthrough
+                or response.status_code != 200
+                or "Content-Encoding" in response.headers
+                or "gzip" not in request.headers.get("Accept-Encoding", "")):
+            return response
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+        return response
+
+
+def build_view_queries(table: str, has_cpu_sum: bool = True, use_name_index: bool = True) -> dict:
+    """Pre-build the (count_sql, sql) pair for every (view, search) combination."""
+    queries = {}
+    for view, view_filter in VIEW_FILTERS.items():
+        for search in (None, "index", "like"):
+            where_clauses = [view_filter] if view_filter else []
+            if search:
+                # The trigram index answers LIKE '%...%' without scanning every name
+                where_clauses.append(name_match_sql(table, search == "index" and use_name_index))
+            where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+            count_sql = f'SELECT COUNT(*) FROM "{table}" {where_sql}'
+            sql = f'''
+        SELECT 
+            "index",
+            cpu_time_total,
+            cpu_time_self,
+            cpu_time_children,
+            {cpu_sum_expr(has_cpu_sum)} as cpu_sum,
+            name,
+            parent_index,
+            CASE WHEN parent_index IS NULL AND "index" IS NOT NULL THEN 1 ELSE 0 END as is_parent
+        FROM "{table}"
+        {where_sql}
+        {VIEW_ORDERS[view]}
+        LIMIT ?
+    '''
+            queries[(view, search)] = (count_sql, sql)
+    return queries
+
+
+def get_conn() -> sqlite3.Connection:
+    """Return the request's database connection, taken from the pool or opened and tuned."""
+    conn = g.get("conn")
+    if conn is not None:
+        return conn
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=512, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            try:
+                conn.execute(pragma)
+            except sqlite3.DatabaseError:
+                # e.g. journal_mode=WAL on a read-only database file
+                pass
+    g.conn = conn
+    return conn
+
+
+@app.teardown_appcontext
+def release_conn(exc):
+    """Return the request's connection to the pool, closing it if the pool is full."""
+    conn = g.pop("conn", None)
+    if conn is None:
+        return
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def format_row_html(row) -> str:
+    """Render one result row as a <tr> element."""
+    index = row["index"]
+    parent_index = row["parent_index"]
+    if row["is_parent"]:
+        row_class = "parent-row"
+    elif parent_index:
+        row_class = "child-row"
+    else:
+        row_class = ""
+    index_cell = f'<a href="?index={index}&view=children" class="index-link">[{index}]</a>' if index else ""
+    parent_cell = (f'<a href="?index={parent_index}&view=children" class="index-link">[{parent_index}]</a>'
+                   if parent_index else "")
+    # Numbers are formatted here, once per cell, rather than by Jinja filters
+    cpu_total, cpu_self, cpu_children, cpu_sum = (
+        row["cpu_time_total"], row["cpu_time_self"], row["cpu_time_children"], row["cpu_sum"])
+    cpu_total = f"{cpu_total:.2f}" if cpu_total else ""
+    cpu_self = f"{cpu_self:.6f}" if cpu_self else ""
+    cpu_children = f"{cpu_children:.6f}" if cpu_children else ""
+    cpu_sum = f"{cpu_sum:.6f}" if cpu_sum else ""
+    return (
+        f'<tr class="{row_class}">'
+        f'<td>{index_cell}</td>'
+        f'<td class="right-align">{cpu_total}</td>'
+        f'<td class="right-align">{cpu_self}</td>'
+        f'<td class="right-align">{cpu_children}</td>'
+        f'<td class="right-align">{cpu_sum}</td>'
+        f'<td>{html.escape(row["name"] or "")}</td>'
+        f'<td>{parent_cell}</td>'
+        '</tr>\n'
+    )
+
 
 @app.route('/')
 def index():
     """Main view handler."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn()
     cursor = conn.cursor()
     
     # Get parameters
@@ -231,79 +394,60 @@ def index():
     search = request.args.get('search', '')
     current_index = request.args.get('index', '')
     
-    # Build query based on view type
-    where_clauses = []
+    # Build query parameters based on view type
     params = []
     title = ""
     breadcrumb = ""
     
     if current_index:
         # Show specific index and its children
-        where_clauses.append("(\"index\" = ? OR parent_index = ?)")
-        params.extend([int(current_index), int(current_index)])
+        index_value = int(current_index)
+        params.extend([index_value, index_value])
         title = f"Index [{current_index}] and its children"
-        breadcrumb = f'Index <a href="?index={current_index}&view=children">[{current_index}]</a>'
+        # The breadcrumb is rendered |safe, so it only embeds the parsed integer
+        breadcrumb = f'Index <a href="?index={index_value}&view=children">[{index_value}]</a>'
         view = 'children'
     elif view == 'parents':
-        where_clauses.append("parent_index IS NULL")
         title = "Parent Rows Only"
     elif view == 'top_cpu':
-        where_clauses.append("cpu_time_total IS NOT NULL")
         title = f"Top {limit} by CPU Time"
     
     if search:
-        where_clauses.append("name LIKE ?")
         params.append(f"%{search}%")
         if title:
             title += f" (filtered by '{search}')"
         else:
             title = f"Results for '{search}'"
     
-    # Build WHERE clause
-    where_sql = ""
-    if where_clauses:
-        where_sql = "WHERE " + " AND ".join(where_clauses)
+    if current_index:
+        # The children view orders its own index first
+        params.append(index_value)
     
-    # Build ORDER BY clause
-    if view == 'top_cpu':
-        order_sql = "ORDER BY cpu_time_total DESC"
-    elif current_index:
-        order_sql = "ORDER BY CASE WHEN \"index\" = ? THEN 0 ELSE 1 END, ROWID"
-        params.insert(0, int(current_index))
+    query_view = view if view in VIEW_FILTERS else 'all'
+    if not search:
+        search_kind = None
+    elif trigram_searchable(search):
+        search_kind = "index"
     else:
-        order_sql = "ORDER BY ROWID"
+        search_kind = "like"
+    count_sql, sql = VIEW_QUERIES[(query_view, search_kind)]
     
-    # Get total count
-    count_sql = f'SELECT COUNT(*) FROM "{TABLE_NAME}" {where_sql}'
-    cursor.execute(count_sql, params if not current_index else params[1:] if params else [])
+    # Get total count; the trailing ORDER BY index only binds to the row query
+    cursor.execute(count_sql, params[:-1] if current_index else params)
     total_rows = cursor.fetchone()[0]
     
     # Get rows
-    sql = f'''
-        SELECT 
-            "index",
-            cpu_time_total,
-            cpu_time_self,
-            cpu_time_children,
-            COALESCE(cpu_time_self, 0) + COALESCE(cpu_time_children, 0) as cpu_sum,
-            name,
-            parent_index,
-            CASE WHEN parent_index IS NULL AND "index" IS NOT NULL THEN 1 ELSE 0 END as is_parent
-        FROM "{TABLE_NAME}"
-        {where_sql}
-        {order_sql}
-        LIMIT ?
-    '''
     params.append(limit)
     
     cursor.execute(sql, params)
     rows = cursor.fetchall()
     
-    conn.close()
+    # Build the table body in Python rather than with per-cell Jinja logic
+    tbody = Markup("".join([format_row_html(row) for row in rows]))
     
-    return render_template_string(
-        HTML_TEMPLATE,
+    return COMPILED_TEMPLATE.render(
         rows=rows,
+        tbody=tbody,
         view=view,
         limit=limit,
         search=search,
@@ -328,10 +472,17 @@ def main():
     
     # Verify database exists
     try:
-        conn = sqlite3.connect(args.db_path)
+        conn = sqlite3.connect(args.db_path, cached_statements=512, isolation_level=None)
+        # Only a plain identifier naming an existing table is ever put into SQL text
+        validate_table_name(conn, args.table)
         cursor = conn.cursor()
         cursor.execute(f'SELECT COUNT(*) FROM "{args.table}"')
         count = cursor.fetchone()[0]
+        ensure_indexes(conn, args.table)
+        # A read-only older database may still lack the generated cpu_sum column
+        has_cpu_sum = 'cpu_sum' in table_columns(conn, args.table)
+        # ...or the name search index, in which case searches use plain LIKE
+        use_name_index = has_name_index(conn, args.table)
         conn.close()
         print(f"Database loaded: {count} rows in table '{args.table}'")
     except Exception as e:
@@ -340,11 +491,18 @@ def main():
     
     DB_PATH = args.db_path
     TABLE_NAME = args.table
+    VIEW_QUERIES.update(build_view_queries(TABLE_NAME, has_cpu_sum, use_name_index))
     
     print(f"\nStarting web server at http://{args.host}:{args.port}")
     print("Press Ctrl+C to stop\n")
     
-    app.run(host=args.host, port=args.port, debug=False)
+    # Either server handles requests on concurrent threads (Flask's own has
+    # started one per request since 1.0); waitress caps them at WORKER_THREADS
+    # and is the production-grade option.  Both share the connection pool.
+    if serve is not None:
+        serve(app, host=args.host, port=args.port, threads=WORKER_THREADS)
+    else:
+        app.run(host=args.host, port=args.port, debug=False)
 
 
 if __name__ == "__main__":